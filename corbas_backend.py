@@ -9,66 +9,354 @@ Installation:
 pip install flask flask-cors spacy pymupdf
 python -m spacy download en_core_web_sm
 pip install pymusas
+mypyc corbas_fallback.py   # optional, compiles the fallback tagger (pip install mypy)
+pip install pyahocorasick  # optional, single-pass multi-phrase PDF search
+pip install orjson         # optional, faster JSON responses
+pip install diskcache      # optional, caches /analyze results on disk
+pip install blake3         # optional, faster cache keys
 
 Run:
 ----
+gunicorn -c gunicorn_conf.py corbas_backend:app
+
+or, for local development with the Flask dev server:
+
 python corbas_backend.py
 
 The server will run on http://localhost:5000
+
+BLAS/OpenMP libraries are limited to one thread each, since requests already
+run concurrently. For single-user, low-latency use set e.g.
+OMP_NUM_THREADS=4 (and OPENBLAS_NUM_THREADS / MKL_NUM_THREADS) before starting.
+
+With diskcache installed, /analyze results are cached in CORBAS_CACHE_DIR
+(default ~/.cache/corbas, up to 1 GB). Prefix corpus_name with "nocache:"
+to bypass the cache for a request.
 """
 
+# Must happen before numpy/spaCy are imported; explicit env settings win
+import os
+os.environ.setdefault('OPENBLAS_NUM_THREADS', '1')
+os.environ.setdefault('MKL_NUM_THREADS', '1')
+os.environ.setdefault('OMP_NUM_THREADS', '1')
+
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
+import numpy
 import spacy
-import fitz  # PyMuPDF
-import io
+from spacy.attrs import POS, TAG, DEP, LEMMA, HEAD, IS_STOP, IS_PUNCT
+from spacy.tokens import Token
+import hashlib
+import importlib.util
+import queue
+import re
+import tempfile
+import threading
+import time
 from datetime import datetime
 
+import corbas_fallback
+from corbas_pdf_search import ensure_pymupdf, search_pdf
+
+# A mypyc build of corbas_fallback shadows the .py; don't let a stale one
+# silently ignore later edits to the word lists or rules
+if not corbas_fallback.__file__.endswith('.py'):
+    _fallback_source = os.path.join(os.path.dirname(corbas_fallback.__file__), 'corbas_fallback.py')
+    if os.path.exists(_fallback_source) and os.path.getmtime(_fallback_source) > os.path.getmtime(corbas_fallback.__file__):
+        print("⚠ Warning: corbas_fallback.py is newer than its compiled build; using the .py (re-run mypyc)")
+        _spec = importlib.util.spec_from_file_location('corbas_fallback', _fallback_source)
+        corbas_fallback = importlib.util.module_from_spec(_spec)
+        _spec.loader.exec_module(corbas_fallback)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
-# Load spaCy model
-print("Loading spaCy model...")
-nlp = spacy.load("en_core_web_sm")
+# orjson encodes the large /analyze payloads much faster than Flask's json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def json_response(payload):
+    """JSON response, encoded with orjson when available"""
+    if HAS_ORJSON:
+        return app.response_class(orjson.dumps(payload), mimetype='application/json')
+    return jsonify(payload)
 
-# Add PyMUSAS to spaCy pipeline with proper initialization
-print("Loading PyMUSAS...")
+
+# PyMUSAS is loaded here at import, not on first use: gunicorn's preload_app
+# then shares the tagger copy-on-write across workers, and the first /analyze
+# request doesn't wait on the lexicon download. Only PyMuPDF is lazy (see
+# corbas_pdf_search.ensure_pymupdf).
 HAS_PYMUSAS = False
-try:
-    from pymusas.rankers.lexicon_entry import ContextualRuleBasedRanker
-    from pymusas.taggers.rules.single_word import SingleWordRule
-    from pymusas.taggers.rules.mwe import MWERule
-    from pymusas.pos_mapper import UPOS_TO_USAS_CORE
+
+# Under `python corbas_backend.py`, PDF search pool processes re-run this
+# script as __mp_main__; they never touch the model, so don't load it there.
+if __name__ == '__mp_main__':
+    nlp = None
+else:
+    # Load spaCy model
+    print("Loading spaCy model...")
+    nlp = spacy.load("en_core_web_sm")
     
-    print("Downloading PyMUSAS English lexicon...")
-    import pymusas.lexicon_collection
-    lexicon_lookup = pymusas.lexicon_collection.LexiconCollection.from_tsv(
-        tsv_file_path=None,
-        include_pos=True
-    )
+    # Add PyMUSAS to spaCy pipeline with proper initialization
+    print("Loading PyMUSAS...")
+    try:
+        from pymusas.rankers.lexicon_entry import ContextualRuleBasedRanker
+        from pymusas.taggers.rules.single_word import SingleWordRule
+        from pymusas.taggers.rules.mwe import MWERule
+        from pymusas.pos_mapper import UPOS_TO_USAS_CORE
+        from pymusas.lexicon_collection import LexiconCollection
+        
+        print("Downloading PyMUSAS English lexicon...")
+        lexicon_lookup = LexiconCollection.from_tsv(
+            tsv_file_path=None,
+            include_pos=True
+        )
+        
+        ranker = ContextualRuleBasedRanker(*ContextualRuleBasedRanker.get_construction_arguments(lexicon_lookup))
+        
+        single_word_rule = SingleWordRule(lexicon_lookup, ranker)
+        mwe_rule = MWERule(lexicon_lookup, ranker)
+        
+        config = {
+            "rules": [mwe_rule, single_word_rule],
+            "ranker": ranker,
+            "pos_mapper": UPOS_TO_USAS_CORE
+        }
+        
+        nlp.add_pipe('pymusas_rule_based_tagger', config=config, last=True)
+        HAS_PYMUSAS = True
+        print("✓ PyMUSAS loaded successfully with English lexicon!")
+        
+    except Exception as e:
+        print(f"⚠ Warning: Could not load PyMUSAS properly: {e}")
+        print("Continuing with spaCy-only tagging + fallback semantic tagger...")
+        HAS_PYMUSAS = False
     
-    ranker = ContextualRuleBasedRanker(*pymusas.rankers.lexicon_entry.ContextualRuleBasedRanker.get_construction_arguments(lexicon_lookup))
+    print("Backend ready!")
+    print(f"Pipelines loaded: {nlp.pipe_names}")
+
+
+# Micro-batching: concurrent /analyze requests are coalesced into a single
+# nlp.pipe() call instead of running nlp(text) once per request.
+BATCH_MAX_SIZE = 128     # max texts per nlp.pipe() call
+BATCH_MAX_WAIT = 0.02    # seconds to wait for more texts before flushing
+
+# Each server worker process gets an equal share of the cores for PDF search
+# pools, so gunicorn's workers don't each start cpu_count processes
+# (gunicorn_conf.py sets CORBAS_WORKERS)
+MULTIPROCESS_MAX = max(1, (os.cpu_count() or 1) // max(1, int(os.environ.get('CORBAS_WORKERS', 1))))
+
+_pending_texts = queue.Queue()
+_batch_thread = None
+_batch_thread_lock = threading.Lock()
+
+
+def pick_batch_size(texts):
+    """nlp.pipe() batch size by median text length: big batches only for short texts"""
+    lengths = sorted(len(text) for text in texts)
+    median = lengths[len(lengths) // 2] if lengths else 0
+    if median < 500:
+        return 128
+    if median < 2000:
+        return 32
+    return 8
+
+
+def pipe_texts(texts, disable=(), batch_size=None):
+    """Run nlp.pipe() over texts sorted by length; docs come back in input order"""
+    if batch_size is None:
+        batch_size = pick_batch_size(texts)
     
-    single_word_rule = SingleWordRule(lexicon_lookup, ranker)
-    mwe_rule = MWERule(lexicon_lookup, ranker)
+    # Similar lengths in a batch means less padding work per batch
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    docs = [None] * len(texts)
+    parsed = nlp.pipe((texts[i] for i in order), batch_size=batch_size, disable=list(disable))
+    for i, doc in zip(order, parsed):
+        docs[i] = doc
+    return docs
+
+
+class _PendingText:
+    """A text waiting to be parsed by the batch worker"""
+
+    def __init__(self, text, disable=()):
+        self.text = text
+        self.disable = disable
+        self.doc = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def _batch_worker():
+    """Collect pending texts for up to BATCH_MAX_WAIT and parse them together"""
+    while True:
+        batch = [_pending_texts.get()]
+        deadline = time.monotonic() + BATCH_MAX_WAIT
+        while len(batch) < BATCH_MAX_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_pending_texts.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        # Texts with different disabled components can't share a pipe() call
+        groups = {}
+        for item in batch:
+            groups.setdefault(item.disable, []).append(item)
+        
+        for disable, items in groups.items():
+            try:
+                docs = pipe_texts([item.text for item in items], disable)
+                for item, doc in zip(items, docs):
+                    item.doc = doc
+            except Exception:
+                # Retry one at a time so a bad text only fails its own request
+                for item in items:
+                    try:
+                        item.doc = pipe_texts([item.text], disable)[0]
+                    except Exception as e:
+                        item.error = e
+            finally:
+                for item in items:
+                    item.done.set()
+
+
+def _ensure_batch_worker():
+    """Start the batch worker thread on first use (and again after a fork)
+
+    Threads don't survive fork(), so this must not run at import time when
+    gunicorn preloads the app in its master process.
+    """
+    global _batch_thread
+    with _batch_thread_lock:
+        if _batch_thread is None or not _batch_thread.is_alive():
+            _batch_thread = threading.Thread(target=_batch_worker, name="corbas-nlp-batcher", daemon=True)
+            _batch_thread.start()
+
+
+def parse_texts(texts, disable=()):
+    """Parse texts through the shared micro-batcher, preserving order"""
+    _ensure_batch_worker()
     
-    config = {
-        "rules": [mwe_rule, single_word_rule],
-        "ranker": ranker,
-        "pos_mapper": UPOS_TO_USAS_CORE
-    }
+    disable = tuple(sorted(disable))
+    pending = [_PendingText(text, disable) for text in texts]
+    for item in pending:
+        _pending_texts.put(item)
+    
+    docs = []
+    for item in pending:
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        docs.append(item.doc)
+    return docs
+
+
+TOKEN_FIELDS = ("word", "pos", "tag", "semantic", "dep", "head", "lemma", "is_stop", "is_punct")
+
+
+# Columns read in one Doc.to_array() call, in this order
+_TOKEN_ATTRS = [POS, TAG, DEP, LEMMA, HEAD, IS_STOP, IS_PUNCT]
+
+
+def serialize_doc(doc, use_pymusas=True):
+    """Convert a parsed Doc into per-field columns, one list per TOKEN_FIELDS entry"""
+    n = len(doc)
+    strings = doc.vocab.strings
+    arr = doc.to_array(_TOKEN_ATTRS)
+    
+    pos = [strings[value] for value in arr[:, 0].tolist()]
+    tag = [strings[value] for value in arr[:, 1].tolist()]
+    # Without the parser DEP is 0 ("") and HEAD is 0, i.e. every token is its own head
+    dep = [strings[value] for value in arr[:, 2].tolist()]
+    lemma = [strings[value] for value in arr[:, 3].tolist()]
+    # HEAD is an offset relative to the token, stored as uint64
+    head = (arr[:, 4].astype(numpy.int64) + numpy.arange(n)).tolist()
+    is_stop = arr[:, 5].astype(bool).tolist()
+    is_punct = arr[:, 6].astype(bool).tolist()
     
-    nlp.add_pipe('pymusas_rule_based_tagger', config=config, last=True)
-    HAS_PYMUSAS = True
-    print("✓ PyMUSAS loaded successfully with English lexicon!")
+    words = [token.text for token in doc]
     
-except Exception as e:
-    print(f"⚠ Warning: Could not load PyMUSAS properly: {e}")
-    print("Continuing with spaCy-only tagging + fallback semantic tagger...")
-    HAS_PYMUSAS = False
+    if use_pymusas and HAS_PYMUSAS and Token.has_extension('pymusas_tags'):
+        semantic = [tags[0] if tags else 'Z99' for tags in (token._.pymusas_tags for token in doc)]
+    else:
+        semantic = [corbas_fallback.fallback_tag(p, l.lower()) for p, l in zip(pos, lemma)]
+    
+    return {
+        "word": words,
+        "pos": pos,
+        "tag": tag,
+        "semantic": semantic,
+        "dep": dep,
+        "head": head,
+        "lemma": lemma,
+        "is_stop": is_stop,
+        "is_punct": is_punct
+    }
+
+
+def format_result(columns, legacy=False):
+    """Response entry for one text: columnar, or a list of token dicts if legacy"""
+    num_tokens = len(columns["word"])
+    if legacy:
+        tokens = [dict(zip(TOKEN_FIELDS, values)) for values in zip(*(columns[field] for field in TOKEN_FIELDS))]
+        return {"tokens": tokens, "num_tokens": num_tokens}
+    return {"columns": columns, "num_tokens": num_tokens}
+
+
+# Result cache: serialized columns per text, keyed by a hash of the text plus
+# everything that changes the output (model versions, PyMUSAS, fallback
+# lexicon, disabled pipes).
+CACHE_DIR = os.environ.get('CORBAS_CACHE_DIR', os.path.expanduser('~/.cache/corbas'))
+CACHE_SIZE_LIMIT = 2 ** 30
+CACHE_FORMAT_VERSION = 2    # bump when serialize_doc() output changes
+
+try:
+    import diskcache
+    HAS_DISKCACHE = True
+except ImportError:
+    HAS_DISKCACHE = False
+
+try:
+    import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+_result_cache = None
+_result_cache_pid = None
+_result_cache_lock = threading.Lock()
+
 
-print("Backend ready!")
-print(f"Pipelines loaded: {nlp.pipe_names}")
+def get_result_cache():
+    """Open the result cache on first use in this process; None if unavailable"""
+    global _result_cache, _result_cache_pid
+    if not HAS_DISKCACHE:
+        return None
+    with _result_cache_lock:
+        # SQLite connections must not be shared across fork()
+        if _result_cache_pid != os.getpid():
+            _result_cache_pid = os.getpid()
+            try:
+                _result_cache = diskcache.Cache(CACHE_DIR, size_limit=CACHE_SIZE_LIMIT, eviction_policy='least-recently-used')
+            except Exception as e:
+                print(f"⚠ Warning: Could not open result cache at {CACHE_DIR}: {e}")
+                _result_cache = None
+        return _result_cache
+
+
+def cache_key(text, disable):
+    """Cache key for a text analyzed with the given disabled components"""
+    pipeline = f"{CACHE_FORMAT_VERSION}|{spacy.__version__}|{nlp.meta.get('name')}-{nlp.meta.get('version')}|{nlp.pipe_names}|{HAS_PYMUSAS}|{corbas_fallback.FALLBACK_VERSION}|{sorted(disable)}"
+    data = text.encode('utf-8')
+    digest = blake3.blake3(data).hexdigest() if HAS_BLAKE3 else hashlib.blake2b(data).hexdigest()
+    return f"{pipeline}|{digest}"
 
 
 @app.route('/health', methods=['GET'])
@@ -79,55 +367,107 @@ def health():
         "message": "CorBas backend is running",
         "spacy": True,
         "pymusas": HAS_PYMUSAS,
-        "pymupdf": True,
+        "pymupdf": importlib.util.find_spec('fitz') is not None,
         "pipes": nlp.pipe_names
     })
 
 
 @app.route('/analyze', methods=['POST'])
 def analyze_text():
-    """Analyze text with spaCy and PyMUSAS"""
+    """Analyze text with spaCy and PyMUSAS
+
+    Accepts either {"text": "..."} or {"texts": ["...", ...]}. A list of texts
+    is parsed in one batch and returned as {"results": [...]}, one entry per text.
+
+    Optional "disable": a list of pipeline components to skip (see /health
+    "pipes"), e.g. ["parser", "ner"] for POS + semantic tags only. By default
+    the full pipeline runs. Skipped components leave their fields empty; with
+    the PyMUSAS tagger disabled the fallback semantic tagger is used.
+
+    Optional "batch_size" is passed to nlp.pipe() and runs the request's texts
+    on their own instead of through the shared batcher. By default the batch
+    size follows the median text length. "n_process" may only be 1: spaCy
+    starts multi-process pipes with fork(), which isn't safe inside the
+    threaded server.
+
+    Tokens are returned column-wise as {"columns": {"word": [...], "pos": [...],
+    ...}}. Pass "legacy": true to get {"tokens": [{"word": ..., ...}, ...]}.
+    """
     try:
         data = request.get_json()
         
-        if not data or 'text' not in data:
+        if not data or ('text' not in data and 'texts' not in data):
             return jsonify({"error": "No text provided"}), 400
         
-        text = data['text']
-        corpus_name = data.get('corpus_name', 'unnamed')
+        if 'texts' in data:
+            texts = data['texts']
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                return jsonify({"error": "'texts' must be a list of strings"}), 400
+        else:
+            if not isinstance(data['text'], str):
+                return jsonify({"error": "'text' must be a string"}), 400
+            texts = [data['text']]
         
-        print(f"Analyzing text for corpus: {corpus_name} ({len(text)} chars)")
+        if any(len(text) > nlp.max_length for text in texts):
+            return jsonify({"error": f"Text too long: max {nlp.max_length} characters per text"}), 400
         
-        doc = nlp(text)
+        disable = data.get('disable', [])
+        if not isinstance(disable, list):
+            return jsonify({"error": "'disable' must be a list of pipeline names"}), 400
+        unknown = [name for name in disable if name not in nlp.pipe_names]
+        if unknown:
+            return jsonify({"error": f"Unknown pipeline components: {unknown}", "pipes": nlp.pipe_names}), 400
         
-        tokens = []
+        batch_size = data.get('batch_size')
+        if batch_size is not None and (isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size < 1):
+            return jsonify({"error": "'batch_size' must be a positive integer"}), 400
         
-        for token in doc:
-            if HAS_PYMUSAS and hasattr(token._, 'pymusas_tags'):
-                semantic_tags = token._.pymusas_tags
-                primary_semantic = semantic_tags[0] if semantic_tags else 'Z99'
+        n_process = data.get('n_process', 1)
+        if isinstance(n_process, bool) or n_process != 1:
+            return jsonify({"error": "'n_process' must be 1; multi-process parsing isn't supported by the server"}), 400
+        
+        corpus_name = data.get('corpus_name', 'unnamed')
+        
+        print(f"Analyzing {len(texts)} text(s) for corpus: {corpus_name} ({sum(len(t) for t in texts)} chars)")
+        
+        cache = None if str(corpus_name).startswith('nocache:') else get_result_cache()
+        columns = [None] * len(texts)
+        keys = None
+        if cache is not None:
+            keys = [cache_key(text, disable) for text in texts]
+            columns = [cache.get(key) for key in keys]
+        missing = [i for i, cached in enumerate(columns) if cached is None]
+        
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            if batch_size is not None:
+                docs = pipe_texts(missing_texts, disable, batch_size)
             else:
-                primary_semantic = get_semantic_fallback(token)
-            
-            token_data = {
-                "word": token.text,
-                "pos": token.pos_,
-                "tag": token.tag_,
-                "semantic": primary_semantic,
-                "dep": token.dep_,
-                "head": token.head.i,
-                "lemma": token.lemma_,
-                "is_stop": token.is_stop,
-                "is_punct": token.is_punct
-            }
+                docs = parse_texts(missing_texts, disable)
             
-            tokens.append(token_data)
+            use_pymusas = 'pymusas_rule_based_tagger' not in disable
+            for i, doc in zip(missing, docs):
+                columns[i] = serialize_doc(doc, use_pymusas)
+                if cache is not None:
+                    cache.set(keys[i], columns[i])
         
-        print(f"✓ Successfully analyzed {len(tokens)} tokens")
+        if len(missing) < len(texts):
+            print(f"✓ {len(texts) - len(missing)} text(s) served from cache")
         
-        return jsonify({
-            "tokens": tokens,
-            "num_tokens": len(tokens),
+        legacy = bool(data.get('legacy', False))
+        results = [format_result(text_columns, legacy) for text_columns in columns]
+        
+        print(f"✓ Successfully analyzed {sum(result['num_tokens'] for result in results)} tokens")
+        
+        if 'texts' in data:
+            return json_response({
+                "results": results,
+                "corpus_name": corpus_name,
+                "has_pymusas": HAS_PYMUSAS
+            })
+        
+        return json_response({
+            **results[0],
             "corpus_name": corpus_name,
             "has_pymusas": HAS_PYMUSAS
         })
@@ -159,56 +499,90 @@ def highlight_pdf():
         
         color_hex = request.form.get('color', '#FFFF00')
         color_hex = color_hex.lstrip('#')
-        r = int(color_hex[0:2], 16) / 255
-        g = int(color_hex[2:4], 16) / 255
-        b = int(color_hex[4:6], 16) / 255
+        if not re.fullmatch(r'[0-9a-fA-F]{6}', color_hex):
+            return jsonify({"error": "'color' must be a hex colour like #FFFF00"}), 400
+        rgb = tuple(channel / 255 for channel in bytes.fromhex(color_hex))
+        creation_date = datetime.now().strftime("%Y%m%d%H%M%S")
         
         print(f"Highlighting {len(phrases)} phrases in PDF: {file.filename}")
         
-        pdf_bytes = file.read()
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        fitz = ensure_pymupdf()
         
-        total_highlights = 0
+        # Normalize once, not per page. Matching is case-insensitive, so
+        # case variants ("Love", "love") are one phrase, annotated under the
+        # first spelling given, whichever search path handles it.
+        normalized = []
+        seen = set()
+        for phrase in phrases:
+            phrase_lower = phrase.lower().strip()
+            if phrase_lower and phrase_lower not in seen:
+                seen.add(phrase_lower)
+                normalized.append((phrase, phrase_lower))
         
-        for page_num in range(len(pdf_document)):
-            page = pdf_document[page_num]
+        # Work from a temp file rather than the upload's bytes in memory;
+        # large-PDF search workers open the same file instead of each
+        # receiving a copy
+        fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+        os.close(fd)
+        pdf_document = None
+        try:
+            file.save(pdf_path)
+            pdf_document = fitz.open(pdf_path)
             
-            for phrase in phrases:
-                phrase_lower = phrase.lower().strip()
-                
-                # Search case-insensitive
-                text_instances = page.search_for(phrase_lower, flags=fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_LIGATURES)
-                text_instances.extend(page.search_for(phrase, flags=fitz.TEXT_PRESERVE_WHITESPACE | fitz.TEXT_PRESERVE_LIGATURES))
-                
-                for inst in text_instances:
-                    highlight = page.add_highlight_annot(inst)
-                    highlight.set_colors(stroke=(r, g, b))
-                    highlight.set_opacity(0.4)
-                    highlight.set_info(
-                        title="CorBas",
-                        content=f'"{phrase}"',
-                        creationDate=datetime.now().strftime("%Y%m%d%H%M%S")
-                    )
-                    highlight.update()
+            # One annotation per phrase per page, covering all of its occurrences.
+            # Rects found by both the lowercase and original-case search_for()
+            # calls are only highlighted once.
+            grouped = {}
+            total_highlights = 0
+            for page_num, phrase, rects in search_pdf(pdf_document, pdf_path, normalized, MULTIPROCESS_MAX):
+                group = grouped.setdefault((page_num, phrase), {})
+                new_rects = [rect for rect in rects if tuple(rect) not in group]
+                if new_rects:
+                    group.update((tuple(rect), rect) for rect in new_rects)
                     total_highlights += 1
-        
-        print(f"✓ Successfully highlighted {total_highlights} occurrences")
-        
-        output_bytes = pdf_document.write()
-        pdf_document.close()
-        
-        output = io.BytesIO(output_bytes)
-        output.seek(0)
+            
+            page = None
+            for (page_num, phrase), group in grouped.items():
+                if page is None or page.number != page_num:
+                    page = pdf_document[page_num]
+                
+                highlight = page.add_highlight_annot(list(group.values()))
+                highlight.set_colors(stroke=rgb)
+                highlight.set_opacity(0.4)
+                highlight.set_info(
+                    title="CorBas",
+                    content=f'"{phrase}"',
+                    creationDate=creation_date
+                )
+                highlight.update()
+            
+            print(f"✓ Successfully highlighted {total_highlights} occurrences")
+            
+            # Write the result to disk rather than memory, so peak RSS doesn't
+            # grow with the PDF and the server can sendfile() it
+            output = tempfile.TemporaryFile()
+            pdf_document.save(output, garbage=3, deflate=True)
+            output_size = output.tell()
+            output.seek(0)
+        finally:
+            if pdf_document is not None:
+                pdf_document.close()
+            os.remove(pdf_path)
         
         original_name = file.filename.rsplit('.', 1)[0]
         output_filename = f"{original_name}_highlighted.pdf"
         
-        return send_file(
+        response = send_file(
             output,
             mimetype='application/pdf',
             as_attachment=True,
             download_name=output_filename
         )
+        # after_this_request would run before the body is streamed, so close
+        # (and delete) the temp file when the response itself is closed
+        response.call_on_close(output.close)
+        response.content_length = output_size
+        return response
     
     except Exception as e:
         print(f"✗ Error highlighting PDF: {str(e)}")
@@ -217,69 +591,6 @@ def highlight_pdf():
         return jsonify({"error": str(e)}), 500
 
 
-def get_semantic_fallback(token):
-    """Fallback semantic tagger based on POS and word forms"""
-    pos = token.pos_
-    lemma = token.lemma_.lower()
-    
-    emotion_positive = {'happy', 'joy', 'delighted', 'pleased', 'excited', 'love', 'wonderful'}
-    emotion_negative = {'sad', 'angry', 'fear', 'hate', 'anxious', 'worried', 'upset', 'depressed'}
-    
-    if lemma in emotion_positive:
-        return 'E1.1+'
-    if lemma in emotion_negative:
-        return 'E1.1-'
-    
-    movement_verbs = {'go', 'come', 'move', 'walk', 'run', 'travel', 'arrive', 'leave', 'enter', 'exit'}
-    if lemma in movement_verbs:
-        return 'M1'
-    
-    speech_verbs = {'say', 'tell', 'speak', 'talk', 'communicate', 'discuss', 'mention', 'ask', 'answer'}
-    if lemma in speech_verbs:
-        return 'Q2.2'
-    
-    thought_verbs = {'think', 'believe', 'know', 'understand', 'consider', 'realize', 'remember', 'forget'}
-    if lemma in thought_verbs:
-        return 'X2.1'
-    
-    positive_adj = {'good', 'great', 'excellent', 'wonderful', 'amazing', 'beautiful', 'perfect', 'nice', 'fine'}
-    negative_adj = {'bad', 'poor', 'terrible', 'awful', 'horrible', 'ugly', 'wrong', 'worse', 'worst'}
-    
-    if lemma in positive_adj:
-        return 'A5.1+'
-    if lemma in negative_adj:
-        return 'A5.1-'
-    
-    time_words = {'today', 'tomorrow', 'yesterday', 'now', 'then', 'soon', 'later', 'before', 'after'}
-    if lemma in time_words:
-        return 'T1'
-    
-    place_words = {'here', 'there', 'where', 'place', 'location', 'home', 'school', 'office'}
-    if lemma in place_words:
-        return 'M7'
-    
-    if pos == 'NOUN':
-        return 'O2'
-    elif pos == 'PROPN':
-        return 'Z3'
-    elif pos == 'VERB':
-        return 'A3+'
-    elif pos == 'ADJ':
-        return 'A5'
-    elif pos == 'ADV':
-        return 'A13'
-    elif pos == 'NUM':
-        return 'N1'
-    elif pos == 'ADP':
-        return 'Z5'
-    elif pos == 'DET':
-        return 'Z5'
-    elif pos == 'PRON':
-        return 'Z8'
-    else:
-        return 'Z99'
-
-
 @app.route('/corbas.html')
 def serve_html():
     """Serve the HTML file"""
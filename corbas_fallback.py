@@ -0,0 +1,98 @@
+"""
+CorBas Fallback Semantic Tagger
+===============================
+Rule-based USAS-style tags from a token's POS and lemma, used when PyMUSAS
+is not available. Called once per token, so this module is kept free of
+spaCy objects and fully type-annotated so it can be compiled with mypyc.
+
+Build (optional):
+-----------------
+pip install mypy
+mypyc corbas_fallback.py
+
+This produces a corbas_fallback.*.so next to this file, which Python imports
+instead of the .py. corbas_backend falls back to the .py (with a warning) if
+the .py is newer than the build, so rebuild after editing this file.
+"""
+
+import hashlib
+from typing import Dict, List, Tuple
+
+# Word lists for the fallback semantic tagger, in priority order
+_FALLBACK_WORD_LISTS: List[Tuple[str, List[str]]] = [
+    ('E1.1+', ['happy', 'joy', 'delighted', 'pleased', 'excited', 'love', 'wonderful']),
+    ('E1.1-', ['sad', 'angry', 'fear', 'hate', 'anxious', 'worried', 'upset', 'depressed']),
+    ('M1', ['go', 'come', 'move', 'walk', 'run', 'travel', 'arrive', 'leave', 'enter', 'exit']),
+    ('Q2.2', ['say', 'tell', 'speak', 'talk', 'communicate', 'discuss', 'mention', 'ask', 'answer']),
+    ('X2.1', ['think', 'believe', 'know', 'understand', 'consider', 'realize', 'remember', 'forget']),
+    ('A5.1+', ['good', 'great', 'excellent', 'wonderful', 'amazing', 'beautiful', 'perfect', 'nice', 'fine']),
+    ('A5.1-', ['bad', 'poor', 'terrible', 'awful', 'horrible', 'ugly', 'wrong', 'worse', 'worst']),
+    ('T1', ['today', 'tomorrow', 'yesterday', 'now', 'then', 'soon', 'later', 'before', 'after']),
+    ('M7', ['here', 'there', 'where', 'place', 'location', 'home', 'school', 'office']),
+]
+
+
+def _build_lemma_tags() -> Dict[str, str]:
+    """Lemma -> tag; the first list a lemma appears in wins (e.g. 'wonderful' -> E1.1+)"""
+    lemma_tags: Dict[str, str] = {}
+    for tag, lemmas in _FALLBACK_WORD_LISTS:
+        for lemma in lemmas:
+            lemma_tags.setdefault(lemma, tag)
+    return lemma_tags
+
+
+_LEMMA_TAG: Dict[str, str] = _build_lemma_tags()
+
+# Frequent non-word tokens skip the lexicon lookup entirely
+_PUNCT_TAGS: Dict[str, str] = {'PUNCT': 'PUNC', 'SPACE': 'Z99', 'SYM': 'Z99', 'X': 'Z99'}
+
+_POS_TAG: Dict[str, str] = {
+    'NOUN': 'O2',
+    'PROPN': 'Z3',
+    'VERB': 'A3+',
+    'ADJ': 'A5',
+    'ADV': 'A13',
+    'NUM': 'N1',
+    'ADP': 'Z5',
+    'DET': 'Z5',
+    'PRON': 'Z8',
+}
+
+
+def _tables_digest() -> str:
+    """Short hash of the tag tables, so caches of tagged output notice edits"""
+    tables = repr((sorted(_PUNCT_TAGS.items()), sorted(_LEMMA_TAG.items()), sorted(_POS_TAG.items())))
+    return hashlib.sha1(tables.encode('utf-8')).hexdigest()[:12]
+
+
+# Changes whenever a word list or tag table changes
+FALLBACK_VERSION: str = _tables_digest()
+
+
+# Memo of (POS, lemma) -> tag. A plain dict rather than functools.lru_cache,
+# so cache hits stay inside the compiled function; cleared when full.
+_CACHE_MAX_SIZE = 131072
+_cache: Dict[Tuple[str, str], str] = {}
+
+
+def fallback_tag(pos: str, lemma: str) -> str:
+    """Fallback semantic tag for a (POS, lowercased lemma) pair"""
+    key = (pos, lemma)
+    tag = _cache.get(key)
+    if tag is None:
+        tag = _lookup(pos, lemma)
+        if len(_cache) >= _CACHE_MAX_SIZE:
+            _cache.clear()
+        _cache[key] = tag
+    return tag
+
+
+def _lookup(pos: str, lemma: str) -> str:
+    """Uncached fallback tag: punctuation, then the lexicon, then POS"""
+    tag = _PUNCT_TAGS.get(pos)
+    if tag:
+        return tag
+    tag = _LEMMA_TAG.get(lemma)
+    if tag:
+        return tag
+    return _POS_TAG.get(pos, 'Z99')
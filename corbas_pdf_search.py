@@ -0,0 +1,190 @@
+"""
+CorBas PDF Phrase Search
+========================
+Finds highlight phrases on PDF pages with PyMuPDF. Large PDFs are searched
+in a pool of worker processes. This module deliberately doesn't import
+spaCy or the Flask app, so pool workers start quickly and don't load the
+NLP model.
+"""
+
+import multiprocessing
+import threading
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+fitz = None             # PyMuPDF, set by ensure_pymupdf()
+SEARCH_FLAGS = None
+
+
+def ensure_pymupdf():
+    """Import PyMuPDF on first call; returns the fitz module"""
+    global fitz, SEARCH_FLAGS
+    if fitz is None:
+        import fitz as pymupdf
+        SEARCH_FLAGS = pymupdf.TEXT_PRESERVE_WHITESPACE | pymupdf.TEXT_PRESERVE_LIGATURES
+        fitz = pymupdf
+    return fitz
+
+
+# With pyahocorasick installed all phrases are found in one pass over each
+# page's words instead of one page.search_for() call per phrase.
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+
+def build_phrase_automaton(phrases):
+    """Build an Aho-Corasick automaton over (phrase, phrase_lower) pairs"""
+    automaton = ahocorasick.Automaton()
+    for phrase, phrase_lower in phrases:
+        automaton.add_word(phrase_lower, (phrase, len(phrase_lower)))
+    automaton.make_automaton()
+    return automaton
+
+
+def find_phrase_rects(page, automaton):
+    """Find automaton phrases on a page; returns [(phrase, [rects])]
+
+    Page words are joined with single spaces into one lowercased string.
+    Each hit is mapped back to the words it covers, giving one rect per text
+    line. Partial words at either end are trimmed by character offset.
+    """
+    words = page.get_text("words", flags=SEARCH_FLAGS)
+    if not words:
+        return []
+    
+    lowered = [w[4].lower() for w in words]
+    starts = []
+    offset = 0
+    for word in lowered:
+        starts.append(offset)
+        offset += len(word) + 1
+    text = ' '.join(lowered)
+    
+    matches = []
+    for end, (phrase, length) in automaton.iter(text):
+        start = end - length + 1
+        first = bisect_right(starts, start) - 1
+        last = bisect_right(starts, end) - 1
+        
+        line_rects = {}
+        for i in range(first, last + 1):
+            x0, y0, x1, y1, word, block_no, line_no = words[i][:7]
+            if i == first or i == last:
+                n = len(lowered[i]) or 1
+                lo = max(start - starts[i], 0) / n
+                hi = min(end + 1 - starts[i], n) / n
+                x0, x1 = x0 + (x1 - x0) * lo, x0 + (x1 - x0) * hi
+            rect = fitz.Rect(x0, y0, x1, y1)
+            key = (block_no, line_no)
+            if key in line_rects:
+                line_rects[key] |= rect
+            else:
+                line_rects[key] = rect
+        
+        matches.append((phrase, list(line_rects.values())))
+    
+    return matches
+
+
+def prepare_phrase_search(normalized):
+    """Split (phrase, phrase_lower) pairs into an automaton and search_for() phrases"""
+    # Phrases with irregular whitespace can't be matched against the
+    # space-joined word text, so they keep using page.search_for()
+    if not HAS_AHOCORASICK:
+        return None, normalized
+    word_phrases = [pair for pair in normalized if pair[1] == ' '.join(pair[1].split())]
+    search_phrases = [pair for pair in normalized if pair[1] != ' '.join(pair[1].split())]
+    automaton = build_phrase_automaton(word_phrases) if word_phrases else None
+    return automaton, search_phrases
+
+
+def find_page_matches(page, automaton, search_phrases):
+    """All highlight matches on one page as [(phrase, [rects])]"""
+    matches = find_phrase_rects(page, automaton) if automaton else []
+    
+    for phrase, phrase_lower in search_phrases:
+        # Search case-insensitive
+        text_instances = page.search_for(phrase_lower, flags=SEARCH_FLAGS)
+        if phrase != phrase_lower:
+            text_instances.extend(page.search_for(phrase, flags=SEARCH_FLAGS))
+        matches.extend((phrase, [inst]) for inst in text_instances)
+    
+    return matches
+
+
+# PyMuPDF is not thread-safe, so large PDFs are searched in worker processes,
+# each opening its own copy of the document from disk. Annotations are added
+# afterwards in the request thread.
+PARALLEL_MIN_PAGES = 16    # pages per worker process before it's worth starting one
+
+# Only one search pool per server process at a time; concurrent large PDFs
+# are searched serially in their request thread instead of starting more
+# processes
+_pool_slot = threading.Semaphore(1)
+
+
+def _pool_context():
+    """Start method for the search pool
+
+    Never fork: the server process is running request and batcher threads.
+    (The same reason /analyze doesn't offer spaCy's nlp.pipe(n_process>1),
+    which starts its workers with the platform default, fork on Linux.)
+    forkserver forks from a clean single-threaded server that has only this
+    module and PyMuPDF preloaded; spawn is used where forkserver isn't
+    available.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__, 'fitz'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _search_pages(pdf_path, page_nums, normalized):
+    """Worker process: search the given pages; returns [(page_num, phrase, rects)]"""
+    ensure_pymupdf()
+    automaton, search_phrases = prepare_phrase_search(normalized)
+    pdf_document = fitz.open(pdf_path)
+    try:
+        return [
+            (page_num, phrase, [tuple(rect) for rect in rects])
+            for page_num in page_nums
+            for phrase, rects in find_page_matches(pdf_document[page_num], automaton, search_phrases)
+        ]
+    finally:
+        pdf_document.close()
+
+
+def search_pdf(pdf_document, pdf_path, normalized, max_workers=1):
+    """Search every page, in parallel for large PDFs; returns [(page_num, phrase, rects)] by page
+
+    pdf_path is the file pdf_document was opened from; workers open it themselves.
+    max_workers caps the pool size, i.e. this server process's share of the cores.
+    """
+    page_count = len(pdf_document)
+    workers = min(max_workers, page_count // PARALLEL_MIN_PAGES)
+    
+    if workers <= 1 or not _pool_slot.acquire(blocking=False):
+        automaton, search_phrases = prepare_phrase_search(normalized)
+        return [
+            (page_num, phrase, rects)
+            for page_num in range(page_count)
+            for phrase, rects in find_page_matches(pdf_document[page_num], automaton, search_phrases)
+        ]
+    
+    try:
+        # Strided page sets keep the workers balanced when text density varies
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(), initializer=ensure_pymupdf) as executor:
+            futures = [
+                executor.submit(_search_pages, pdf_path, list(range(i, page_count, workers)), normalized)
+                for i in range(workers)
+            ]
+            results = [match for future in futures for match in future.result()]
+    finally:
+        _pool_slot.release()
+    
+    results.sort(key=lambda match: match[0])
+    return [(page_num, phrase, [fitz.Rect(rect) for rect in rects]) for page_num, phrase, rects in results]
@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the CorBas backend
+=============================================
+Runs several worker processes so long PDF highlighting and NLP requests
+don't block each other the way the single-process Flask dev server does.
+
+Run:
+----
+pip install gunicorn
+gunicorn -c gunicorn_conf.py corbas_backend:app
+
+Settings can be overridden with CORBAS_BIND, CORBAS_WORKERS and CORBAS_THREADS.
+"""
+
+import os
+
+bind = os.environ.get('CORBAS_BIND', '127.0.0.1:5000')
+
+workers = int(os.environ.get('CORBAS_WORKERS', os.cpu_count() or 1))
+
+# Tell the app how many workers share the machine; corbas_backend divides the
+# cores between them for PDF search pools
+os.environ['CORBAS_WORKERS'] = str(workers)
+
+# Import corbas_backend (and load spaCy + PyMUSAS) once in the master, then
+# fork; workers share the model's memory copy-on-write instead of each
+# loading their own. The /analyze batch thread is started lazily, so each
+# worker gets its own after the fork.
+preload_app = True
+
+# Real threads rather than gevent: spaCy and PyMuPDF work is CPU-bound C code
+# that would block a gevent hub, and the /analyze micro-batcher relies on
+# concurrent request threads feeding its queue.
+worker_class = 'gthread'
+threads = int(os.environ.get('CORBAS_THREADS', 4))
+
+# Large PDFs can take minutes to highlight
+timeout = 120